@@ -0,0 +1,19 @@
+from types import MappingProxyType
+
+## client capabilities sent with the initialize request: only what this client uses, documentSymbol and
+## references on opened documents.
+CAPABILITIES = MappingProxyType(
+    {
+        "textDocument": {
+            "documentSymbol": {
+                "symbolKind": {"valueSet": list(range(1, 27))},
+                "hierarchicalDocumentSymbolSupport": True,
+            },
+            "references": {},
+            "synchronization": {},
+        },
+        "workspace": {
+            "workspaceFolders": True,
+        },
+    }
+)
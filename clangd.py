@@ -1,19 +1,28 @@
+import mmap
+import os
+import re
 import subprocess
+from array import array
 import threading
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
 from pathlib import Path
 from sys import stderr
-from time import sleep
-from typing import IO, Any, Dict, List, Set, Union
+from typing import Any, Dict, List, Optional, Set, Tuple, Union
 
 import click
 
 import pylspclient
+import symbol_cache
+from capabilities import CAPABILITIES
 from pylspclient.lsp_client import LspClient
 from pylspclient.lsp_structs import (
     DocumnetSymbol,
     Location,
+    ReferenceContext,
     SymbolInformation,
-    TextDocumentItem,
+    TextDocumentIdentifier,
 )
 
 PHP_LANGUAGE_SERVER = "/home/a-ohta/php-language-server"
@@ -23,19 +32,78 @@ ROOT_DIR = "/home/a-ohta/Buzz/"
 FILE_PATH = "/home/a-ohta/Buzz/lib/Client/Curl.php"
 
 FILE_PARSE_TIMEOUT_SEC = 30
+FILE_READ_WORKERS = 16
+## didOpen notifications sent with a single write
+DID_OPEN_BATCH_SIZE = 64
+## max references requests sent in a single JSON RPC batch
+REFERENCES_BATCH_SIZE = 64
+## a server that ignores batches never answers them
+REFERENCES_BATCH_TIMEOUT_SEC = 60
+## references results kept to answer symbols at the same position, at least REFERENCES_BATCH_SIZE
+REFERENCES_CACHE_SIZE = 4096
+## concurrent references requests when the server does not support batches
+REFERENCES_WORKERS = 8
+## line breaks of LazyDoc lines, as LSP counts them
+LINE_BREAK = re.compile(rb"\r\n|\r|\n")
+## documents whose mmap is kept open by LazyDoc, each holds a file descriptor
+LAZY_DOC_OPEN_MAPS = 64
 _DONE_FILES: Set[str] = set()
+## files opened by open_all_source_files, set before waiting for their diagnostics
+_OPENED_FILES: Set[str] = set()
+_DONE_FILES_LOCK = threading.Lock()
+_ALL_FILES_PARSED = threading.Event()
 
 
-class ReadPipe(threading.Thread):
-    def __init__(self, pipe: IO[bytes]):
-        threading.Thread.__init__(self)
-        self.pipe = pipe
+class LazyDoc(object):
+    """
+    A source file whose lines are read on demand through a read-only mmap, so the client keeps no copy of its
+    text. The line offsets are computed on the first lookup.
 
-    def run(self):
-        line = self.pipe.readline().decode("utf-8")
-        while line:
-            print(line, file=stderr)
-            line = self.pipe.readline().decode("utf-8")
+    A mmap holds a file descriptor, so only the maps of the LAZY_DOC_OPEN_MAPS most recently read documents are
+    kept open, the others are reopened when needed.
+    """
+
+    _open_maps: "OrderedDict[LazyDoc, Union[mmap.mmap, bytes]]" = OrderedDict()
+
+    def __init__(self, uri: str, path: str):
+        self.uri = uri
+        self.path = path
+        self._offsets: Optional[array] = None
+
+    def __data(self) -> Union[mmap.mmap, bytes]:
+        data = LazyDoc._open_maps.get(self)
+        if data is not None:
+            LazyDoc._open_maps.move_to_end(self)
+            return data
+        with open(self.path, "rb") as f:
+            if os.fstat(f.fileno()).st_size:
+                data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            else:
+                data = b""
+        LazyDoc._open_maps[self] = data
+        if len(LazyDoc._open_maps) > LAZY_DOC_OPEN_MAPS:
+            _, oldest = LazyDoc._open_maps.popitem(last=False)
+            if isinstance(oldest, mmap.mmap):
+                oldest.close()
+        return data
+
+    def __load(self, data: Union[mmap.mmap, bytes]):
+        # line starts. As in LSP, \r\n, \n and a bare \r all end a line.
+        offsets = array("Q", [0])
+        offsets.extend(m.end() for m in LINE_BREAK.finditer(data))
+        self._offsets = offsets
+
+    def line(self, n: int) -> str:
+        """
+        Returns the n-th line (zero based), without its line break.
+        """
+        data = self.__data()
+        if self._offsets is None:
+            self.__load(data)
+        start = self._offsets[n]
+        end = self._offsets[n + 1] if n + 1 < len(self._offsets) else len(data)
+        # the line holds no other \r or \n than its line break.
+        return data[start:end].rstrip(b"\r\n").decode("utf-8", errors="replace")
 
 
 def print_reference(
@@ -44,7 +112,7 @@ def print_reference(
     character: int,
     name: str,
     locations: Union[List[Location], Location],
-    documents: Dict[str, TextDocumentItem],
+    documents: Dict[str, LazyDoc],
 ):
     _locations: List[Location] = []
     if isinstance(locations, Location):
@@ -54,211 +122,163 @@ def print_reference(
     if not _locations:
         print(f'"{uri}", {line}, {character}, "{name}"')
     for location in _locations:
-        document = documents[location.uri[len("file://") :]]
         loc_line = location.range.start.line
         loc_chracter = location.range.start.character
-        line_str = document.text.splitlines()[loc_line]
+        line_str = documents[location.uri].line(loc_line)
         print(
             f'"{uri}", {line}, {character}, "{name}", "{location.uri}", {loc_line}, {loc_chracter}, `{line_str}`'
         )
 
 
+def collect_symbols(
+    symbols: List[Union[DocumnetSymbol, SymbolInformation]],
+    uri: str,
+    out: List[Tuple[str, int, int, str]],
+):
+    """
+    Appends (uri, line, character, name) of the symbols and all their children to out, in depth first order
+    with parents first. Uses an explicit stack, so deep symbol trees cost no Python frames.
+    """
+    stack = deque(reversed(symbols))
+    while stack:
+        symbol = stack.pop()
+        if isinstance(symbol, DocumnetSymbol):
+            start = symbol.selectionRange.start
+            stack.extend(reversed(symbol.children))
+        else:
+            start = symbol.location.range.start
+        out.append((uri, start.line, start.character, symbol.name))
+
+
+def references_or_error(
+    lsp_client: LspClient,
+    request: Tuple[
+        TextDocumentIdentifier, pylspclient.lsp_structs.Position, ReferenceContext
+    ],
+) -> Union[List[Location], Location, pylspclient.lsp_structs.ResponseError]:
+    """
+    Sends a single references request. Like a batch, an error fails only this request: it is returned.
+    """
+    try:
+        return lsp_client.references(*request)
+    except pylspclient.lsp_structs.ResponseError as e:
+        return e
+
+
 def get_reference(
     lsp_client: LspClient,
-    symbol: Union[DocumnetSymbol, SymbolInformation],
-    uri: str,
-    documents: Dict[str, TextDocumentItem],
+    symbols: List[Union[DocumnetSymbol, SymbolInformation]],
+    text_document: TextDocumentIdentifier,
+    context: ReferenceContext,
+    documents: Dict[str, LazyDoc],
 ):
-    if isinstance(symbol, DocumnetSymbol):
-        line = symbol.selectionRange.start.line
-        character = symbol.selectionRange.start.character
-        locations = lsp_client.references(
-            pylspclient.lsp_structs.TextDocumentIdentifier(uri=uri),
-            pylspclient.lsp_structs.Position(line=line, character=character),
-            pylspclient.lsp_structs.ReferenceContext(includeDeclaration=True),
-        )
-        print_reference(uri, line, character, symbol.name, locations, documents)
-        for child in symbol.children:
-            get_reference(
-                lsp_client=lsp_client, symbol=child, uri=uri, documents=documents
-            )
-    else:
-        line = symbol.location.range.start.line
-        character = symbol.location.range.start.character
-        locations = lsp_client.references(
-            pylspclient.lsp_structs.TextDocumentIdentifier(uri=uri),
-            pylspclient.lsp_structs.Position(line=line, character=character),
-            pylspclient.lsp_structs.ReferenceContext(includeDeclaration=True),
-        )
-        print_reference(uri, line, character, symbol.name, locations, documents)
-
-
-def open_all_source_files(lsp_client: LspClient, root_dir: Path):
-    opened_files: Dict[str, TextDocumentItem] = {}
-    for file in root_dir.glob("**/*.php"):
-        file_path = str(file.absolute())
-        uri = "file://" + file_path
-        text = open(file_path, "r").read()
-        languageId = pylspclient.lsp_structs.LANGUAGE_IDENTIFIER.PHP
-        version = 1
-        documentItem = pylspclient.lsp_structs.TextDocumentItem(
-            uri=uri, languageId=languageId, version=version, text=text
-        )
-        lsp_client.didOpen(documentItem)
-        opened_files[file_path] = documentItem
+    params: List[Tuple[str, int, int, str]] = []
+    collect_symbols(symbols, text_document.uri, params)
+    # the same position shows up for overlapping symbols, e.g. a class and its constructor on the same line, so
+    # the references of the most recent positions are kept and each position is requested once.
+    cache: "OrderedDict[Tuple[int, int], Union[List[Location], Location]]" = (
+        OrderedDict()
+    )
+    use_batch = True
+    with ThreadPoolExecutor(max_workers=REFERENCES_WORKERS) as executor:
+        for i in range(0, len(params), REFERENCES_BATCH_SIZE):
+            chunk = params[i : i + REFERENCES_BATCH_SIZE]
+            positions = []
+            for position in dict.fromkeys((line, char) for _, line, char, _ in chunk):
+                if position in cache:
+                    cache.move_to_end(position)
+                else:
+                    positions.append(position)
+            # all the requests share the same (immutable) text document and context.
+            requests = [
+                (
+                    text_document,
+                    pylspclient.lsp_structs.Position(line=line, character=character),
+                    context,
+                )
+                for line, character in positions
+            ]
+
+            results = None
+            if use_batch and requests:
+                try:
+                    results = lsp_client.referencesBatch(
+                        requests, timeout=REFERENCES_BATCH_TIMEOUT_SEC
+                    )
+                except (pylspclient.lsp_structs.BatchRejectedError, TimeoutError):
+                    print(
+                        "Batch rejected, sending references concurrently", file=stderr
+                    )
+                    use_batch = False
+            if results is None:
+                results = executor.map(
+                    lambda request: references_or_error(lsp_client, request), requests
+                )
+            # the results follow positions, which are in the order the chunk first needs them: each result is
+            # cached and printed as it comes in, without waiting for the rest of the chunk.
+            pending = zip(positions, results)
+            errors: Dict[Tuple[int, int], pylspclient.lsp_structs.ResponseError] = {}
+            for uri, line, character, name in chunk:
+                if (line, character) not in cache and (line, character) not in errors:
+                    position, locations = next(pending)
+                    if isinstance(locations, pylspclient.lsp_structs.ResponseError):
+                        errors[position] = locations
+                    else:
+                        cache[position] = locations
+                        if len(cache) > REFERENCES_CACHE_SIZE:
+                            cache.popitem(last=False)
+                error = errors.get((line, character))
+                if error is not None:
+                    print(
+                        f"references failed: {uri}, {line}, {character}: {error.message}",
+                        file=stderr,
+                    )
+                    print_reference(uri, line, character, name, [], documents)
+                else:
+                    print_reference(
+                        uri, line, character, name, cache[line, character], documents
+                    )
+
+
+def read_source_file(file: Path) -> Tuple[str, str]:
+    return str(file.absolute()), file.read_text(encoding="utf-8", errors="replace")
+
+
+def open_all_source_files(lsp_client: LspClient, root_dir: Path) -> Dict[str, LazyDoc]:
+    """
+    Opens all the source files under root_dir, and returns the opened documents by uri, as the server reports them.
+    Only the server keeps the text, the returned documents read their lines from the files when needed.
+    """
+    opened_files: Dict[str, LazyDoc] = {}
+    files = root_dir.glob("**/*.php")
+    # read the files in parallel, but send didOpen from this thread only. Only the next window of files is read
+    # ahead while a window is sent, so at most two windows of texts are held at a time.
+    with ThreadPoolExecutor(max_workers=FILE_READ_WORKERS) as executor:
+        window = [
+            executor.submit(read_source_file, file)
+            for file in islice(files, DID_OPEN_BATCH_SIZE)
+        ]
+        while window:
+            next_window = [
+                executor.submit(read_source_file, file)
+                for file in islice(files, DID_OPEN_BATCH_SIZE)
+            ]
+            pending: List[Tuple[str, str, int, str]] = []
+            for future in window:
+                file_path, text = future.result()
+                uri = "file://" + file_path
+                languageId = pylspclient.lsp_structs.LANGUAGE_IDENTIFIER.PHP.value
+                version = 1
+                opened_files[uri] = LazyDoc(uri, file_path)
+                pending.append((uri, languageId, version, text))
+            lsp_client.didOpenBatch(pending)
+            window = next_window
     return opened_files
 
 
-def start_communication(lsp_client: LspClient, server_p: subprocess.Popen[bytes]):
-    capabilities = {
-        "textDocument": {
-            "codeAction": {"dynamicRegistration": True},
-            "codeLens": {"dynamicRegistration": True},
-            "colorProvider": {"dynamicRegistration": True},
-            "completion": {
-                "completionItem": {
-                    "commitCharactersSupport": True,
-                    "documentationFormat": ["markdown", "plaintext"],
-                    "snippetSupport": True,
-                },
-                "completionItemKind": {
-                    "valueSet": [
-                        1,
-                        2,
-                        3,
-                        4,
-                        5,
-                        6,
-                        7,
-                        8,
-                        9,
-                        10,
-                        11,
-                        12,
-                        13,
-                        14,
-                        15,
-                        16,
-                        17,
-                        18,
-                        19,
-                        20,
-                        21,
-                        22,
-                        23,
-                        24,
-                        25,
-                    ]
-                },
-                "contextSupport": True,
-                "dynamicRegistration": True,
-            },
-            "definition": {"dynamicRegistration": True},
-            "documentHighlight": {"dynamicRegistration": True},
-            "documentLink": {"dynamicRegistration": True},
-            "documentSymbol": {
-                "dynamicRegistration": True,
-                "symbolKind": {
-                    "valueSet": [
-                        1,
-                        2,
-                        3,
-                        4,
-                        5,
-                        6,
-                        7,
-                        8,
-                        9,
-                        10,
-                        11,
-                        12,
-                        13,
-                        14,
-                        15,
-                        16,
-                        17,
-                        18,
-                        19,
-                        20,
-                        21,
-                        22,
-                        23,
-                        24,
-                        25,
-                        26,
-                    ]
-                },
-                "hierarchicalDocumentSymbolSupport": True,
-            },
-            "formatting": {"dynamicRegistration": True},
-            "hover": {
-                "contentFormat": ["markdown", "plaintext"],
-                "dynamicRegistration": True,
-            },
-            "implementation": {"dynamicRegistration": True},
-            "onTypeFormatting": {"dynamicRegistration": True},
-            "publishDiagnostics": {"relatedInformation": True},
-            "rangeFormatting": {"dynamicRegistration": True},
-            "references": {"dynamicRegistration": True},
-            "rename": {"dynamicRegistration": True},
-            "signatureHelp": {
-                "dynamicRegistration": True,
-                "signatureInformation": {
-                    "documentationFormat": ["markdown", "plaintext"]
-                },
-            },
-            "synchronization": {
-                "didSave": True,
-                "dynamicRegistration": True,
-                "willSave": True,
-                "willSaveWaitUntil": True,
-            },
-            "typeDefinition": {"dynamicRegistration": True},
-        },
-        "workspace": {
-            "references": {"dynamicRegistration": True},
-            "applyEdit": True,
-            "configuration": True,
-            "didChangeConfiguration": {"dynamicRegistration": True},
-            "didChangeWatchedFiles": {"dynamicRegistration": True},
-            "executeCommand": {"dynamicRegistration": True},
-            "symbol": {
-                "dynamicRegistration": True,
-                "symbolKind": {
-                    "valueSet": [
-                        1,
-                        2,
-                        3,
-                        4,
-                        5,
-                        6,
-                        7,
-                        8,
-                        9,
-                        10,
-                        11,
-                        12,
-                        13,
-                        14,
-                        15,
-                        16,
-                        17,
-                        18,
-                        19,
-                        20,
-                        21,
-                        22,
-                        23,
-                        24,
-                        25,
-                        26,
-                    ]
-                },
-            },
-            "workspaceEdit": {"documentChanges": True},
-            "workspaceFolders": True,
-        },
-    }
+def start_communication(
+    lsp_client: LspClient, server_p: subprocess.Popen[bytes], server: str
+):
     root_uri = f"file:/{ROOT_DIR}"
     workspace_folders = [{"name": "python-lsp", "uri": root_uri}]
     print("before initialized", file=stderr)
@@ -268,7 +288,7 @@ def start_communication(lsp_client: LspClient, server_p: subprocess.Popen[bytes]
             rootPath=None,
             rootUri=root_uri,
             initializationOptions=None,
-            capabilities=capabilities,
+            capabilities=CAPABILITIES,
             trace="verbose",
             workspaceFolders=workspace_folders,
         ),
@@ -278,23 +298,32 @@ def start_communication(lsp_client: LspClient, server_p: subprocess.Popen[bytes]
     print(lsp_client.initialized(), file=stderr)
     print("after initialized", file=stderr)
     documents = open_all_source_files(lsp_client=lsp_client, root_dir=Path(ROOT_DIR))
-    files = set([document.uri for _, document in documents.items()])
-    for _ in range(FILE_PARSE_TIMEOUT_SEC):
-        if _DONE_FILES == files:
-            break
-        sleep(1)
-    else:
+    with _DONE_FILES_LOCK:
+        _OPENED_FILES.update(documents)
+        if _DONE_FILES >= _OPENED_FILES:
+            _ALL_FILES_PARSED.set()
+    if not _ALL_FILES_PARSED.wait(timeout=FILE_PARSE_TIMEOUT_SEC):
         print("file parse timeout", file=stderr)
         return
 
-    documentItem = documents[FILE_PATH]
+    text_document = TextDocumentIdentifier(uri="file://" + FILE_PATH)
     try:
-        symbols = lsp_client.documentSymbol(documentItem)
+        cache_key = symbol_cache.cache_key(server, text_document.uri, FILE_PATH)
+        symbols = symbol_cache.get(cache_key)
+        if symbols is None:
+            symbols = lsp_client.documentSymbol(text_document)
+            symbol_cache.put(cache_key, symbols)
         print(
-            f"Get references for all symbols in file: {documentItem.uri}.", file=stderr
+            f"Get references for all symbols in file: {text_document.uri}.",
+            file=stderr,
+        )
+        get_reference(
+            lsp_client,
+            symbols,
+            text_document,
+            ReferenceContext(includeDeclaration=True),
+            documents,
         )
-        for symbol in symbols:
-            get_reference(lsp_client, symbol, documentItem.uri, documents)
     except pylspclient.lsp_structs.ResponseError as e:
         # documentSymbol is supported from version 8.
         print(e, file=stderr)
@@ -303,7 +332,10 @@ def start_communication(lsp_client: LspClient, server_p: subprocess.Popen[bytes]
 
 def publishDiagnostics(arg: Dict[str, Any]):
     uri = arg["uri"]
-    _DONE_FILES.add(uri)
+    with _DONE_FILES_LOCK:
+        _DONE_FILES.add(uri)
+        if _OPENED_FILES and _DONE_FILES >= _OPENED_FILES:
+            _ALL_FILES_PARSED.set()
     print(f"Parse end: {uri}", file=stderr)
 
 
@@ -320,11 +352,10 @@ def main(server: str):
         phpls if server == "phpls" else intelephense,
         stdin=subprocess.PIPE,
         stdout=subprocess.PIPE,
-        stderr=subprocess.PIPE,
+        # the server writes its logs straight to our stderr, no thread has to forward them.
+        stderr=None,
     )
-    assert p.stderr and p.stdin and p.stdout
-    read_pipe = ReadPipe(p.stderr)
-    read_pipe.start()
+    assert p.stdin and p.stdout
     json_rpc_endpoint = pylspclient.JsonRpcEndpoint(p.stdin, p.stdout)
     # To work with socket: sock_fd = sock.makefile()
     lsp_endpoint = pylspclient.LspEndpoint(
@@ -335,7 +366,7 @@ def main(server: str):
 
     lsp_client = pylspclient.LspClient(lsp_endpoint)
     try:
-        start_communication(lsp_client=lsp_client, server_p=p)
+        start_communication(lsp_client=lsp_client, server_p=p, server=server)
     finally:
         lsp_client.shutdown()
         lsp_client.exit()
@@ -1,10 +1,22 @@
+import enum
+import io
 import json
+import os
 import threading
-from typing import IO, Any, Dict, Union
+from typing import IO, Any, Dict, List, Mapping, Union
+
+from pydantic import BaseModel
 
 from pylspclient import lsp_structs
 
-JSON_RPC_REQ_FORMAT = "Content-Length: {json_string_len}\r\n\r\n{json_string}"
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+JSON_RPC_REQ_HEADER = b"Content-Length: %d\r\n\r\n"
+## max buffers written by a single os.writev call
+IOV_MAX = 1024
 LEN_HEADER = "Content-Length: "
 TYPE_HEADER = "Content-Type: "
 
@@ -18,7 +30,51 @@ class MyEncoder(json.JSONEncoder):
     """
 
     def default(self, o: Any):  # pylint: disable=E0202
-        return o.__dict__
+        return _default(o)
+
+
+def _default(o: Any):
+    if isinstance(o, BaseModel):
+        # unset optional fields are left out rather than sent as null, as .json(exclude_none=True) would,
+        # without building the model's dict through pydantic.
+        return {k: v for k, v in o.__dict__.items() if v is not None}
+    if isinstance(o, lsp_structs.ResponseError):
+        error = {"code": o.code, "message": o.message}
+        if o.data is not None:
+            error["data"] = o.data
+        return error
+    if isinstance(o, Mapping):
+        # e.g. a read-only MappingProxyType
+        return dict(o)
+    if isinstance(o, enum.Enum):
+        return o.value
+    return o.__dict__
+
+
+def dumps(o: Any) -> bytes:
+    """
+    Encodes an object in compact UTF-8 JSON, using orjson when it is installed.
+
+    :param object o: The object to encode. Mappings that are not dicts are encoded as dicts, models by
+        their fields that are not None, enums by their value, other objects that are not JSON types by their
+        __dict__.
+    :return: the encoded bytes
+    """
+    if orjson is not None:
+        return orjson.dumps(o, default=_default)
+    return json.dumps(o, cls=MyEncoder, separators=(",", ":")).encode("utf-8")
+
+
+def loads(b: bytes) -> Any:
+    """
+    Decodes UTF-8 JSON, using orjson when it is installed.
+
+    :param bytes b: The bytes to decode.
+    :return: the decoded object
+    """
+    if orjson is not None:
+        return orjson.loads(b)
+    return json.loads(b)
 
 
 class JsonRpcEndpoint(object):
@@ -34,16 +90,14 @@ class JsonRpcEndpoint(object):
         self.write_lock = threading.Lock()
 
     @staticmethod
-    def __add_header(json_string: str):
+    def __add_header(json_bytes: bytes):
         """
-        Adds a header for the given json string
+        Adds a header for the given json bytes
 
-        :param str json_string: The string
-        :return: the string with the header
+        :param bytes json_bytes: The encoded json
+        :return: the bytes with the header
         """
-        return JSON_RPC_REQ_FORMAT.format(
-            json_string_len=len(json_string), json_string=json_string
-        )
+        return JSON_RPC_REQ_HEADER % len(json_bytes) + json_bytes
 
     def send_request(self, message: Dict[str, Union[str, int, None]]):
         """
@@ -51,17 +105,60 @@ class JsonRpcEndpoint(object):
 
         :param dict message: The message to send.
         """
-        json_string = json.dumps(message, cls=MyEncoder)
-        jsonrpc_req = self.__add_header(json_string)
+        jsonrpc_req = self.__add_header(dumps(message))
+        with self.write_lock:
+            self.stdin.write(jsonrpc_req)
+            self.stdin.flush()
+
+    def send_batch(self, messages: List[Dict[str, Any]]):
+        """
+        Sends the given messages as a single JSON RPC batch (one framed JSON array).
+
+        :param list messages: The messages to send.
+        """
+        jsonrpc_req = self.__add_header(dumps(messages))
+        with self.write_lock:
+            self.stdin.write(jsonrpc_req)
+            self.stdin.flush()
+
+    def send_requests(self, messages: List[Union[Dict[str, Any], bytes]]):
+        """
+        Sends the given messages one after the other, each framed on its own, with as few write syscalls as possible.
+        Unlike send_batch, the peer sees separate messages, so this works for servers without batch support.
+
+        :param list messages: The messages to send. A bytes message is taken as already encoded json.
+        """
+        chunks: List[Any] = []
+        for message in messages:
+            json_bytes = message if isinstance(message, bytes) else dumps(message)
+            chunks.append(JSON_RPC_REQ_HEADER % len(json_bytes))
+            chunks.append(json_bytes)
         with self.write_lock:
-            self.stdin.write(jsonrpc_req.encode())
             self.stdin.flush()
+            try:
+                fd = self.stdin.fileno()
+            except (AttributeError, io.UnsupportedOperation):
+                fd = None
+            if fd is None or not hasattr(os, "writev"):
+                # no file descriptor, or no writev on this platform.
+                self.stdin.write(b"".join(chunks))
+                self.stdin.flush()
+                return
+            i = 0
+            while i < len(chunks):
+                written = os.writev(fd, chunks[i : i + IOV_MAX])
+                # skip what was written, a pipe or a socket may take only part of the buffers.
+                while i < len(chunks) and written >= len(chunks[i]):
+                    written -= len(chunks[i])
+                    i += 1
+                if written:
+                    chunks[i] = memoryview(chunks[i])[written:]
 
     def recv_response(self):
         """
         Recives a message.
 
-        :return: a message
+        :return: a message, or a list of messages for a batch response
         """
         with self.read_lock:
             message_size = None
@@ -101,5 +198,5 @@ class JsonRpcEndpoint(object):
                     lsp_structs.ErrorCodes.ParseError, "Bad header: missing size"
                 )
 
-            jsonrpc_res = self.stdout.read(message_size).decode("utf-8")
-            return json.loads(jsonrpc_res)
+            jsonrpc_res = self.stdout.read(message_size)
+            return loads(jsonrpc_res)
@@ -1,6 +1,7 @@
 import uuid
-from typing import Any, List, Optional, Union
+from typing import Any, Iterator, List, Optional, Tuple, Union
 
+from pylspclient.json_rpc_endpoint import dumps
 from pylspclient.lsp_endpoint import LspEndpoint
 from pylspclient.lsp_structs import (
     CompletionContext,
@@ -11,12 +12,19 @@ from pylspclient.lsp_structs import (
     LocationLink,
     Position,
     ReferenceContext,
+    ResponseError,
     SignatureHelp,
     SymbolInformation,
     TextDocumentContentChangeEvent,
     TextDocumentIdentifier,
     TextDocumentItem,
     VersionedTextDocumentIdentifier,
+    constructor,
+    to_type,
+)
+
+DID_OPEN_PARAMS_TEMPLATE = (
+    b'{"textDocument":{"uri":%s,"languageId":%s,"version":%d,"text":%s}}'
 )
 
 
@@ -120,6 +128,25 @@ class LspClient(object):
             "textDocument/didOpen", textDocument=textDocument
         )
 
+    def didOpenBatch(self, textDocuments: List[Tuple[str, str, int, str]]):
+        """
+        Sends a didOpen notification for each of the given documents, all in one write.
+
+        :param list textDocuments: The documents that were opened, as (uri, languageId, version, text) tuples, the
+            fields of TextDocumentItem. No model is built for them: they are only written out.
+        """
+        # the documents are the bulk of the payload, so only their strings go through the json encoder.
+        return self.lsp_endpoint.send_notification_batch(
+            [
+                (
+                    "textDocument/didOpen",
+                    DID_OPEN_PARAMS_TEMPLATE
+                    % (dumps(uri), dumps(languageId), version, dumps(text)),
+                )
+                for uri, languageId, version, text in textDocuments
+            ]
+        )
+
     def didChange(
         self,
         textDocument: VersionedTextDocumentIdentifier,
@@ -141,13 +168,13 @@ class LspClient(object):
         )
 
     def documentSymbol(
-        self, textDocument: TextDocumentItem
+        self, textDocument: TextDocumentIdentifier
     ) -> List[Union[SymbolInformation, DocumnetSymbol]]:
         """
         The document symbol request is sent from the client to the server to return a flat list of all symbols found in a given text document.
         Neither the symbol's location range nor the symbol's container name should be used to infer a hierarchy.
 
-        :param TextDocumentItem textDocument: The text document.
+        :param TextDocumentIdentifier textDocument: The text document.
         """
         result_dict = self.lsp_endpoint.call_method(
             "textDocument/documentSymbol", textDocument=textDocument
@@ -155,9 +182,9 @@ class LspClient(object):
         if not result_dict:
             return []
         if "range" in result_dict[0]:
-            return [DocumnetSymbol.parse_obj(sym) for sym in result_dict]
+            return list(map(constructor(DocumnetSymbol), result_dict))
         else:
-            return [SymbolInformation.parse_obj(sym) for sym in result_dict]
+            return list(map(constructor(SymbolInformation), result_dict))
 
     def workspaceSymbol(self) -> List[SymbolInformation]:
         """
@@ -169,7 +196,7 @@ class LspClient(object):
         result_dict = self.lsp_endpoint.call_method("workspace/symbol", query="")
         if not result_dict:
             return []
-        return [SymbolInformation.parse_obj(sym) for sym in result_dict]
+        return list(map(constructor(SymbolInformation), result_dict))
 
     def typeDefinition(
         self, textDocument: TextDocumentItem, position: Position
@@ -185,7 +212,7 @@ class LspClient(object):
         )
         if not result_dict:
             return []
-        return [Location(**l) for l in result_dict]
+        return list(map(constructor(Location), result_dict))
 
     def signatureHelp(self, textDocument: TextDocumentItem, position: Position):
         """
@@ -197,7 +224,7 @@ class LspClient(object):
         result_dict = self.lsp_endpoint.call_method(
             "textDocument/signatureHelp", textDocument=textDocument, position=position
         )
-        return SignatureHelp.parse_obj(result_dict)
+        return to_type(result_dict, SignatureHelp)
 
     def completion(
         self,
@@ -222,9 +249,9 @@ class LspClient(object):
         if not result_dict:
             return []
         if "isIncomplete" in result_dict:
-            return CompletionList.parse_obj(result_dict)
+            return constructor(CompletionList)(result_dict)
 
-        return [CompletionItem.parse_obj(l) for l in result_dict]
+        return list(map(constructor(CompletionItem), result_dict))
 
     def declaration(
         self, textDocument: TextDocumentItem, position: Position
@@ -245,10 +272,10 @@ class LspClient(object):
         if not result_dict:
             return []
         if "uri" in result_dict:
-            return Location(**result_dict)
+            return constructor(Location)(result_dict)
         if "uri" in result_dict[0]:
-            return [Location.parse_obj(l) for l in result_dict]
-        return [LocationLink.parse_obj(l) for l in result_dict]
+            return list(map(constructor(Location), result_dict))
+        return list(map(constructor(LocationLink), result_dict))
 
     def definition(
         self, textDocument: TextDocumentItem, position: Position
@@ -269,10 +296,10 @@ class LspClient(object):
         if not result_dict:
             return []
         if "uri" in result_dict:
-            return Location(**result_dict)
+            return constructor(Location)(result_dict)
         if "uri" in result_dict[0]:
-            return [Location.parse_obj(l) for l in result_dict]
-        return [LocationLink.parse_obj(l) for l in result_dict]
+            return list(map(constructor(Location), result_dict))
+        return list(map(constructor(LocationLink), result_dict))
 
     def references(
         self,
@@ -294,9 +321,48 @@ class LspClient(object):
             context=context,
             workDoneToken=str(uuid.uuid4()),
         )
+        return self.__to_locations(result_dict)
+
+    def referencesBatch(
+        self,
+        requests: List[Tuple[TextDocumentIdentifier, Position, ReferenceContext]],
+        timeout: Optional[float] = None,
+    ) -> Iterator[Union[List[Location], Location, ResponseError]]:
+        """
+        Sends several references requests as a single JSON RPC batch, saving a round trip per request.
+        Servers that do not support batches reject it with a BatchRejectedError, or do not answer until the timeout.
+
+        :param list requests: (textDocument, position, context) triples, as accepted by references.
+        :param float timeout: How long to wait for the whole batch.
+        :return: the references of each request, in the order of the requests. They are converted to Location
+            lazily, while iterating. A request that failed gets its ResponseError instead.
+        """
+        results = self.lsp_endpoint.call_batch(
+            [
+                (
+                    "textDocument/references",
+                    {
+                        "textDocument": textDocument,
+                        "position": position,
+                        "context": context,
+                        "workDoneToken": str(uuid.uuid4()),
+                    },
+                )
+                for textDocument, position, context in requests
+            ],
+            timeout=timeout,
+        )
+        return map(self.__to_locations, results)
+
+    @staticmethod
+    def __to_locations(
+        result_dict: Any,
+    ) -> Union[List[Location], Location, ResponseError]:
+        if isinstance(result_dict, ResponseError):
+            return result_dict
         if not result_dict:
             return []
         if "uri" in result_dict:
-            return Location(**result_dict)
+            return constructor(Location)(result_dict)
 
-        return [Location(**l) for l in result_dict]
+        return list(map(constructor(Location), result_dict))
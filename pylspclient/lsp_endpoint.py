@@ -1,14 +1,17 @@
 import threading
 from sys import stderr
-from typing import Any, Callable, Dict, Optional, Tuple, Union
+from typing import Any, Callable, Dict, List, Optional, Set, Tuple, Union
 
 from pylspclient import lsp_structs
-from pylspclient.json_rpc_endpoint import JsonRpcEndpoint
+from pylspclient.json_rpc_endpoint import JsonRpcEndpoint, dumps
+
+NOTIFICATION_TEMPLATE = b'{"jsonrpc":"2.0","method":%s,"params":%s}'
 
 
 class LspEndpoint(threading.Thread):
     event_dict: Dict[int, threading.Condition]
     response_dict: Dict[int, Tuple[Any, Any]]
+    batch_ids: Set[int]
 
     def __init__(
         self,
@@ -23,17 +26,36 @@ class LspEndpoint(threading.Thread):
         self.method_callbacks = method_callbacks
         self.event_dict = {}
         self.response_dict = {}
+        self.batch_ids = set()
         self.next_id = 0
+        self.id_lock = threading.Lock()
         self._timeout = timeout
         self.shutdown_flag = False
 
     def handle_result(self, rpc_id: int, result: Any, error: Any):
+        cond = self.event_dict.get(rpc_id)
+        if cond is None:
+            # nobody is waiting for this response anymore (e.g. timed out).
+            return
         self.response_dict[rpc_id] = (result, error)
-        cond = self.event_dict[rpc_id]
         cond.acquire()
         cond.notify()
         cond.release()
 
+    def handle_batch_error(self, error: Any):
+        """
+        Handles an error response without an id. This is how a server rejects a batch it can not process, so all the
+        pending batch calls are failed with a BatchRejectedError.
+        """
+        if not self.batch_ids:
+            print("Error response without id: {error}".format(error=error), file=stderr)
+            return
+        rejection = lsp_structs.BatchRejectedError(
+            error.get("code"), error.get("message"), error.get("data")
+        )
+        for rpc_id in list(self.batch_ids):
+            self.handle_result(rpc_id, None, rejection)
+
     def stop(self):
         self.shutdown_flag = True
 
@@ -44,42 +66,52 @@ class LspEndpoint(threading.Thread):
                 if jsonrpc_message is None:
                     print("server quit", file=stderr)
                     break
-                method = jsonrpc_message.get("method")
-                result = jsonrpc_message.get("result")
-                error = jsonrpc_message.get("error")
-                rpc_id = jsonrpc_message.get("id")
-                params = jsonrpc_message.get("params")
-                try:
-                    if method:
-                        if rpc_id:
-                            # a call for method
-                            if method not in self.method_callbacks:
-                                raise lsp_structs.ResponseError(
-                                    lsp_structs.ErrorCodes.MethodNotFound,
-                                    "Method not found: {method}".format(method=method),
-                                )
-                            result = self.method_callbacks[method](params)
-                            self.send_response(rpc_id, result, None)
-                        else:
-                            # a call for notify
-                            if method not in self.notify_callbacks:
-                                # Have nothing to do with this.
-                                print(
-                                    "Notify method not found: {method}: {param}.".format(
-                                        method=method, param=params
-                                    ),
-                                    file=stderr,
-                                )
-                            else:
-                                self.notify_callbacks[method](params)
-                    else:
-                        self.handle_result(rpc_id, result, error)
-                except lsp_structs.ResponseError as e:
-                    self.send_response(rpc_id, None, e)
+                if isinstance(jsonrpc_message, list):
+                    # a batch of messages
+                    for message in jsonrpc_message:
+                        self.handle_message(message)
+                else:
+                    self.handle_message(jsonrpc_message)
             except lsp_structs.ResponseError as e:
                 ## self.send_response(rpc_id, None, e)
                 pass
 
+    def handle_message(self, jsonrpc_message: Dict[str, Any]):
+        method = jsonrpc_message.get("method")
+        result = jsonrpc_message.get("result")
+        error = jsonrpc_message.get("error")
+        rpc_id = jsonrpc_message.get("id")
+        params = jsonrpc_message.get("params")
+        try:
+            if method:
+                if rpc_id:
+                    # a call for method
+                    if method not in self.method_callbacks:
+                        raise lsp_structs.ResponseError(
+                            lsp_structs.ErrorCodes.MethodNotFound,
+                            "Method not found: {method}".format(method=method),
+                        )
+                    result = self.method_callbacks[method](params)
+                    self.send_response(rpc_id, result, None)
+                else:
+                    # a call for notify
+                    if method not in self.notify_callbacks:
+                        # Have nothing to do with this.
+                        print(
+                            "Notify method not found: {method}: {param}.".format(
+                                method=method, param=params
+                            ),
+                            file=stderr,
+                        )
+                    else:
+                        self.notify_callbacks[method](params)
+            elif rpc_id is None and error:
+                self.handle_batch_error(error)
+            else:
+                self.handle_result(rpc_id, result, error)
+        except lsp_structs.ResponseError as e:
+            self.send_response(rpc_id, None, e)
+
     def send_response(self, id: int, result: Any, error: Any):
         message_dict = {}
         message_dict["jsonrpc"] = "2.0"
@@ -90,23 +122,34 @@ class LspEndpoint(threading.Thread):
             message_dict["error"] = error
         self.json_rpc_endpoint.send_request(message_dict)
 
-    def send_message(
-        self,
+    @staticmethod
+    def __build_message(
         method_name: str,
         params: Dict[str, Union[str, int, None]],
         id: Optional[int] = None,
-    ):
+    ) -> Dict[str, Any]:
         message_dict = {}
         message_dict["jsonrpc"] = "2.0"
         if id is not None:
             message_dict["id"] = id
         message_dict["method"] = method_name
         message_dict["params"] = params
-        self.json_rpc_endpoint.send_request(message_dict)
+        return message_dict
+
+    def send_message(
+        self,
+        method_name: str,
+        params: Dict[str, Union[str, int, None]],
+        id: Optional[int] = None,
+    ):
+        self.json_rpc_endpoint.send_request(
+            self.__build_message(method_name, params, id)
+        )
 
     def call_method(self, method_name: str, **kwargs: Any):
-        current_id = self.next_id
-        self.next_id += 1
+        with self.id_lock:
+            current_id = self.next_id
+            self.next_id += 1
         cond = threading.Condition()
         self.event_dict[current_id] = cond
 
@@ -127,5 +170,77 @@ class LspEndpoint(threading.Thread):
             )
         return result
 
+    def call_batch(
+        self,
+        calls: List[Tuple[str, Dict[str, Any]]],
+        timeout: Optional[float] = None,
+    ) -> List[Any]:
+        """
+        Calls several methods with a single JSON RPC batch and waits for all the responses.
+
+        :param list calls: (method name, params) pairs.
+        :param float timeout: How long to wait for the whole batch, defaults to the endpoint timeout.
+        :return: the results, in the order of the calls. A call that failed gets its ResponseError in place of
+            its result, the other calls of the batch are not affected.
+        :raises BatchRejectedError: when the server rejects the batch as a whole.
+        """
+        if not calls:
+            return []
+        with self.id_lock:
+            ids = list(range(self.next_id, self.next_id + len(calls)))
+            self.next_id += len(calls)
+        cond = threading.Condition()
+        for rpc_id in ids:
+            self.event_dict[rpc_id] = cond
+        self.batch_ids.update(ids)
+        messages = [
+            self.__build_message(method_name, params, rpc_id)
+            for rpc_id, (method_name, params) in zip(ids, calls)
+        ]
+
+        with cond:
+            self.json_rpc_endpoint.send_batch(messages)
+            done = cond.wait_for(
+                lambda: all(rpc_id in self.response_dict for rpc_id in ids),
+                timeout=self._timeout if timeout is None else timeout,
+            )
+
+        self.batch_ids.difference_update(ids)
+        for rpc_id in ids:
+            self.event_dict.pop(rpc_id)
+        responses = [self.response_dict.pop(rpc_id, (None, None)) for rpc_id in ids]
+        if not done:
+            raise TimeoutError()
+        results = []
+        for result, error in responses:
+            if isinstance(error, lsp_structs.BatchRejectedError):
+                raise error
+            if error:
+                result = lsp_structs.ResponseError(
+                    error.get("code"), error.get("message"), error.get("data")
+                )
+            results.append(result)
+        return results
+
     def send_notification(self, method_name: str, **kwargs: Any):
         self.send_message(method_name, kwargs)
+
+    def send_notification_batch(
+        self, notifications: List[Tuple[str, Union[Dict[str, Any], bytes]]]
+    ):
+        """
+        Sends several notifications with a single write, each as a separate JSON RPC message.
+
+        :param list notifications: (method name, params) pairs. bytes params are taken as already encoded json,
+            and spliced into the message without going through the json encoder.
+        """
+        self.json_rpc_endpoint.send_requests(
+            [
+                (
+                    NOTIFICATION_TEMPLATE % (dumps(method_name), params)
+                    if isinstance(params, bytes)
+                    else self.__build_message(method_name, params)
+                )
+                for method_name, params in notifications
+            ]
+        )
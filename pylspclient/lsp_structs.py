@@ -1,22 +1,200 @@
 import enum
-from typing import Any, List, Optional, Type, TypeVar
+import functools
+import sys
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    List,
+    Optional,
+    Tuple,
+    Type,
+    TypeVar,
+    Union,
+    get_args,
+    get_origin,
+    get_type_hints,
+)
 
 from pydantic import BaseModel, Field
 
 T = TypeVar("T")
 
+if hasattr(BaseModel, "model_construct"):
+    # pydantic 2
+
+    def _model_fields(model: Type[BaseModel]) -> Dict[str, Any]:
+        return model.model_fields
+
+    def _model_construct(model: Type[T]) -> Callable[..., T]:
+        return model.model_construct
+
+else:
+
+    def _model_fields(model: Type[BaseModel]) -> Dict[str, Any]:
+        return model.__fields__
+
+    def _model_construct(model: Type[T]) -> Callable[..., T]:
+        return model.construct
+
 
 def to_type(o: Any, new_type: Type[T]) -> T:
     """
     Helper funciton that receives an object or a dict and convert it to a new given type.
 
+    The dict is trusted data, e.g. a payload from the language server, so it is not validated: the model is
+    built with construct() (model_construct() on pydantic 2), and so are its nested models and enums.
+
     :param object|dict o: The object to convert
     :param Type new_type: The type to convert to.
     """
-    if new_type == type(o):
-        return o
+    if o.__class__ is dict:
+        return constructor(new_type)(o)
+    return o
+
+
+def constructor(new_type: Type[T]) -> Callable[[dict], T]:
+    """
+    Returns the function that builds the given type from a dict, as to_type does. Bind it once to convert many
+    dicts, e.g. map(constructor(Location), result), without the to_type call and checks per item.
+
+    :param Type new_type: The type to convert to.
+    """
+    construct = _CONSTRUCTORS.get(new_type)
+    if construct is None:
+        construct = _CONSTRUCTORS[new_type] = _compile_constructor(new_type)
+    return construct
+
+
+def _compile_constructor(new_type: Type[T]) -> Callable[[dict], T]:
+    construct = _compile_node_constructor(new_type)
+    for name, convert, item_type, is_list in _plan(new_type):
+        if is_list and item_type is new_type:
+            # a tree, like DocumnetSymbol.children.
+            return functools.partial(_construct_tree, construct, name)
+    return construct
+
+
+def _construct_tree(construct: Callable[[dict], T], children_name: str, o: dict) -> T:
+    """
+    Builds a tree of models without recursion, so deep trees neither pay a few Python frames per node nor
+    hit the recursion limit. Nodes are built in post-order: the children of a node are built first, and the
+    node gets the built list, which the constructor keeps as it is. Children that are not dicts, e.g. models
+    built by the caller, are kept as they are.
+    """
+    if not o.get(children_name):
+        return construct(o)
+    stack = [(o, False)]
+    built = []
+    while stack:
+        o, expanded = stack.pop()
+        if o.__class__ is not dict:
+            built.append(o)
+            continue
+        children = o.get(children_name)
+        if not children:
+            built.append(construct(o))
+        elif not expanded:
+            stack.append((o, True))
+            stack.extend((child, False) for child in reversed(children))
+        else:
+            node_children = built[-len(children) :]
+            del built[-len(children) :]
+            built.append(construct(dict(o, **{children_name: node_children})))
+    return built[0]
+
+
+def _compile_node_constructor(new_type: Type[T]) -> Callable[[dict], T]:
+    """
+    Generates the function that builds the given model from a dict: one unrolled block per field of its plan,
+    without the loop over the fields and the plan unpacking. The model is then built by construct(), that
+    fills in the defaults of the missing fields.
+    """
+    namespace = {
+        "construct_model": _model_construct(new_type),
+        "construct_list": _construct_list,
+        "missing": _MISSING,
+    }
+    lines = ["def construct(o):", "    values = {}"]
+    for i, (name, convert, item_type, is_list) in enumerate(_plan(new_type)):
+        lines.append(f"    value = o.get({name!r}, missing)")
+        lines.append("    if value is not missing:")
+        if convert is not None:
+            namespace[f"convert_{i}"] = convert
+            namespace[f"item_type_{i}"] = item_type
+            lines.append("        if value is not None:")
+            if is_list:
+                lines.append(
+                    f"            value = construct_list(value, convert_{i}, item_type_{i})"
+                )
+            else:
+                lines.append(f"            value = convert_{i}(value)")
+        lines.append(f"        values[{name!r}] = value")
+    lines.append("    return construct_model(**values)")
+    exec(
+        compile("\n".join(lines), f"<construct {new_type.__name__}>", "exec"), namespace
+    )
+    return namespace["construct"]
+
+
+def _construct_list(
+    value: list, convert: Callable[[Any], Any], item_type: type
+) -> list:
+    if not value:
+        # empty, e.g. the children of a leaf symbol.
+        return value
+    # items already built, e.g. by the caller, are kept as they are.
+    return [v if v.__class__ is item_type else convert(v) for v in value]
+
+
+_MISSING = object()
+
+# constructors generated by _compile_constructor, on first use of each model.
+_CONSTRUCTORS: Dict[type, Callable[[dict], Any]] = {}
+
+# (name, convert, item type, is list) of each field of a model.
+_FieldPlan = Tuple[str, Optional[Callable[[Any], Any]], Optional[type], bool]
+
+# string fields whose values repeat all over the responses, e.g. the uri of every location in a file. They are
+# interned, so the repeated values share one string, and comparing and hashing them is cheap.
+_INTERNED_FIELDS = frozenset(("uri", "targetUri", "languageId", "containerName"))
+
+
+def _plan(new_type: type) -> Tuple[_FieldPlan, ...]:
+    # built on first use, when forward references, like DocumnetSymbol.children, can be resolved.
+    hints = get_type_hints(new_type)
+    return tuple(_field_plan(name, hints[name]) for name in _model_fields(new_type))
+
+
+def _field_plan(name: str, annotation: Any) -> _FieldPlan:
+    if get_origin(annotation) is Union:
+        # Optional
+        args = [arg for arg in get_args(annotation) if arg is not type(None)]
+        if len(args) != 1:
+            return name, None, None, False
+        annotation = args[0]
+    is_list = get_origin(annotation) is list
+    if is_list:
+        annotation = get_args(annotation)[0]
+    if not isinstance(annotation, type):
+        return name, None, None, False
+    if annotation is str and not is_list and name in _INTERNED_FIELDS:
+        return name, sys.intern, None, False
+    if issubclass(annotation, BaseModel):
+        convert = functools.partial(to_type, new_type=annotation)
+    elif issubclass(annotation, enum.Enum):
+        convert = functools.partial(_enum_member, annotation)
     else:
-        return new_type(**o)
+        return name, None, None, False
+    return name, convert, annotation, is_list
+
+
+def _enum_member(enum_type: Type[enum.Enum], value: Any) -> enum.Enum:
+    # the value map lookup skips EnumMeta.__call__, unknown values still go through it to raise.
+    member = enum_type._value2member_map_.get(value)
+    if member is None:
+        return enum_type(value)
+    return member
 
 
 class Position(BaseModel):
@@ -58,7 +236,7 @@ class Diagnostic(BaseModel):
     relatedInformation: List[Any]
 
 
-class DiagnosticSeverity(object):
+class DiagnosticSeverity(enum.IntEnum):
     Error = 1
     Warning = 2  # TODO: warning is known in python
     Information = 3
@@ -94,6 +272,9 @@ class TextDocumentIdentifier(BaseModel):
 
     uri: str
 
+    class Config:
+        frozen = True
+
 
 class VersionedTextDocumentIdentifier(TextDocumentIdentifier):
     """
@@ -102,6 +283,12 @@ class VersionedTextDocumentIdentifier(TextDocumentIdentifier):
 
     version: int
 
+    class Config:
+        frozen = False
+
+    # mutable, so not hashable. It would inherit the frozen parent's hash, that changes with the version.
+    __hash__ = None
+
 
 class TextDocumentContentChangeEvent(BaseModel):
     """
@@ -123,7 +310,11 @@ class TextDocumentPositionParams(BaseModel):
     position: Position
 
 
-class LANGUAGE_IDENTIFIER(object):
+class LANGUAGE_IDENTIFIER(str, enum.Enum):
+    # like enum.StrEnum: str() and formatting give the value.
+    __str__ = str.__str__
+    __format__ = str.__format__
+
     BAT = "bat"
     BIBTEX = "bibtex"
     CLOJURE = "clojure"
@@ -175,7 +366,7 @@ class LANGUAGE_IDENTIFIER(object):
     YAML = "yaml"
 
 
-class SymbolKind(enum.Enum):
+class SymbolKind(enum.IntEnum):
     File = 1
     Module = 2
     Namespace = 3
@@ -264,7 +455,7 @@ class SignatureHelp(BaseModel):
     activeParameter: int = Field(0)
 
 
-class CompletionTriggerKind(enum.Enum):
+class CompletionTriggerKind(enum.IntEnum):
     Invoked = 1
     TriggerCharacter = 2
     TriggerForIncompleteCompletions = 3
@@ -282,6 +473,9 @@ class CompletionContext(BaseModel):
 class ReferenceContext(BaseModel):
     includeDeclaration: bool = Field(False)
 
+    class Config:
+        frozen = True
+
 
 class TextEdit(BaseModel):
     """
@@ -292,7 +486,7 @@ class TextEdit(BaseModel):
     newText: str
 
 
-class InsertTextFormat(enum.Enum):
+class InsertTextFormat(enum.IntEnum):
     PlainText = 1
     Snippet = 2
 
@@ -318,7 +512,7 @@ class CompletionItem(BaseModel):
     score: float = 0.0
 
 
-class CompletionItemKind(enum.Enum):
+class CompletionItemKind(enum.IntEnum):
     Text = 1
     Method = 2
     Function = 3
@@ -355,7 +549,7 @@ class CompletionList(BaseModel):
     items: List[CompletionItem]
 
 
-class ErrorCodes(enum.Enum):
+class ErrorCodes(enum.IntEnum):
     # Defined by JSON RPC
     ParseError = -32700
     InvalidRequest = -32600
@@ -373,8 +567,18 @@ class ErrorCodes(enum.Enum):
 
 
 class ResponseError(Exception):
+    __slots__ = ("code", "message", "data")
+
     def __init__(self, code: ErrorCodes, message: str, data: Optional[Any] = None):
+        super().__init__(code, message, data)
         self.code = code
         self.message = message
-        if data:
-            self.data = data
+        self.data = data
+
+
+class BatchRejectedError(ResponseError):
+    """
+    The server answered a whole batch with a single error, e.g. because it does not support batches.
+    """
+
+    __slots__ = ()
@@ -1,4 +1,5 @@
 #!/usr/bin/env python
+import os
 import sys
 
 from setuptools import setup, find_packages
@@ -21,6 +22,22 @@ class PyTest(TestCommand):
         sys.exit(errno)
 
 
+ext_modules = None
+if not any(arg in sys.argv for arg in ["clean", "check"]) and "SKIP_CYTHON" not in os.environ:
+    # compile the structs module when Cython is installed, otherwise it stays pure Python.
+    try:
+        from Cython.Build import cythonize
+    except ImportError:
+        pass
+    else:
+        # the annotations are for readers, Cython would enforce builtin ones, e.g. type for model classes.
+        ext_modules = cythonize(
+            ["pylspclient/lsp_structs.py"],
+            language_level=3,
+            compiler_directives={"annotation_typing": False},
+        )
+
+
 setup(
     name="pylspclient",
     version="0.0.2",
@@ -31,6 +48,9 @@ setup(
     long_description_content_type="text/markdown",
     url="https://github.com/yeger00/pylspclient",
     packages=find_packages(),
+    # lsp_structs builds trusted models with construct() on pydantic 1, model_construct() on pydantic 2.
+    install_requires=["pydantic>=1.10"],
     tests_require=["pytest", "pytest_mock"],
     cmdclass={"test": PyTest},
+    ext_modules=ext_modules,
 )
@@ -0,0 +1,75 @@
+import hashlib
+import json
+import mmap
+import os
+from pathlib import Path
+from sys import stderr
+from typing import List, Optional, Union
+
+from pydantic import ValidationError
+
+from pylspclient.lsp_structs import DocumnetSymbol, SymbolInformation
+
+CACHE_DIR = Path.home() / ".cache" / "pylspclient"
+
+
+def cache_key(server: str, uri: str, file_path: str) -> str:
+    """
+    Returns the cache key of the given document: a hash of the server, that decides the shape of the symbols,
+    of the document uri and of the file bytes.
+    """
+    hasher = hashlib.blake2b(digest_size=16)
+    hasher.update(server.encode())
+    hasher.update(b"\0")
+    hasher.update(uri.encode())
+    hasher.update(b"\0")
+    with open(file_path, "rb") as f:
+        if os.fstat(f.fileno()).st_size:
+            # hash straight from the page cache, without reading the file into memory.
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                hasher.update(mm)
+    return hasher.hexdigest()
+
+
+def cache_path(key: str) -> Path:
+    return CACHE_DIR / f"{key}.json"
+
+
+def get(key: str) -> Optional[List[Union[SymbolInformation, DocumnetSymbol]]]:
+    """
+    Returns the document symbols cached under the given key, or None when they are not cached.
+    The cache file is not trusted, the symbols are validated.
+    """
+    try:
+        with open(cache_path(key), "r") as f:
+            result_dict = json.load(f)
+        if not isinstance(result_dict, list):
+            return None
+        if result_dict and "range" in result_dict[0]:
+            return list(map(DocumnetSymbol.parse_obj, result_dict))
+        return list(map(SymbolInformation.parse_obj, result_dict))
+    except (OSError, ValueError, ValidationError, KeyError, TypeError):
+        # unreadable, or not a list of symbols: a miss, the symbols are requested again.
+        return None
+
+
+def put(key: str, symbols: List[Union[SymbolInformation, DocumnetSymbol]]):
+    """
+    Caches the document symbols under the given key. Only the symbols are stored, line text is read from the
+    document when needed. Caching is best effort: when the cache can not be written, it is only reported.
+    """
+    path = cache_path(key)
+    tmp_path = path.with_suffix(f".{os.getpid()}.tmp")
+    try:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with open(tmp_path, "w") as f:
+            f.write(
+                "[" + ",".join(sym.json(exclude_defaults=True) for sym in symbols) + "]"
+            )
+        os.replace(tmp_path, path)
+    except OSError as e:
+        print(f"Failed to cache the document symbols: {e}", file=stderr)
+        try:
+            os.unlink(tmp_path)
+        except OSError:
+            pass
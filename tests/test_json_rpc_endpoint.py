@@ -1,13 +1,24 @@
+import json
 import os
+import threading
+import types
 import pylspclient
 import pytest
 
 JSON_RPC_RESULT_LIST = [
-    'Content-Length: 40\r\n\r\n{"key_str": "some_string", "key_num": 1}'.encode("utf-8"),
-    'Content-Length: 40\r\n\r\n{"key_num": 1, "key_str": "some_string"}'.encode("utf-8")
+    'Content-Length: 37\r\n\r\n{"key_str":"some_string","key_num":1}'.encode("utf-8"),
+    'Content-Length: 37\r\n\r\n{"key_num":1,"key_str":"some_string"}'.encode("utf-8")
 ]
 
 
+@pytest.fixture(params=["orjson", "json"])
+def json_backend(request, monkeypatch):
+    if request.param == "json":
+        monkeypatch.setattr(pylspclient.json_rpc_endpoint, "orjson", None)
+    elif pylspclient.json_rpc_endpoint.orjson is None:
+        pytest.skip("orjson is not installed")
+
+
 def test_send_sanity():
     pipein, pipeout = os.pipe()
     pipein = os.fdopen(pipein, "rb")
@@ -33,6 +44,39 @@ def test_send_class():
     assert(result in JSON_RPC_RESULT_LIST)
         
 
+def test_send_mapping_proxy(json_backend):
+    pipein, pipeout = os.pipe()
+    pipein = os.fdopen(pipein, "rb")
+    pipeout = os.fdopen(pipeout, "wb")
+    json_rpc_endpoint = pylspclient.JsonRpcEndpoint(pipeout, None)
+    json_rpc_endpoint.send_request(types.MappingProxyType({"key_num":1, "key_str":"some_string"}))
+    result = pipein.read(len(JSON_RPC_RESULT_LIST[0]))
+    assert(result in JSON_RPC_RESULT_LIST)
+
+
+def test_send_unicode():
+    pipein, pipeout = os.pipe()
+    pipein = os.fdopen(pipein, "rb")
+    pipeout = os.fdopen(pipeout, "wb")
+    json_rpc_endpoint = pylspclient.JsonRpcEndpoint(pipeout, None)
+    json_rpc_endpoint.send_request({"key_str": "\u00e9"})
+    header = pipein.readline()
+    pipein.readline()
+    size = int(header.decode("utf-8")[len("Content-Length: "):-2])
+    # the size is in bytes, whichever way the string is escaped.
+    assert(json.loads(pipein.read(size).decode("utf-8")) == {"key_str": "\u00e9"})
+
+
+def test_send_backends(json_backend):
+    pipein, pipeout = os.pipe()
+    pipein = os.fdopen(pipein, "rb")
+    pipeout = os.fdopen(pipeout, "wb")
+    json_rpc_endpoint = pylspclient.JsonRpcEndpoint(pipeout, None)
+    json_rpc_endpoint.send_request({"key_num":1, "key_str":"some_string"})
+    result = pipein.read(len(JSON_RPC_RESULT_LIST[0]))
+    assert(result in JSON_RPC_RESULT_LIST)
+
+
 def test_recv_sanity():
     pipein, pipeout = os.pipe()
     pipein = os.fdopen(pipein, "rb")
@@ -78,3 +122,61 @@ def test_recv_close_pipe():
     assert(result is None)
 
 
+def test_send_batch():
+    pipein, pipeout = os.pipe()
+    pipein = os.fdopen(pipein, "rb")
+    pipeout = os.fdopen(pipeout, "wb")
+    json_rpc_endpoint = pylspclient.JsonRpcEndpoint(pipeout, None)
+    json_rpc_endpoint.send_batch([{"key_num": 1}, {"key_num": 2}])
+    result = pipein.read(len('Content-Length: 29\r\n\r\n[{"key_num":1},{"key_num":2}]'))
+    assert(result == 'Content-Length: 29\r\n\r\n[{"key_num":1},{"key_num":2}]'.encode("utf-8"))
+
+
+def test_recv_batch():
+    pipein, pipeout = os.pipe()
+    pipein = os.fdopen(pipein, "rb")
+    pipeout = os.fdopen(pipeout, "wb")
+    json_rpc_endpoint = pylspclient.JsonRpcEndpoint(None, pipein)
+    pipeout.write('Content-Length: 32\r\n\r\n[{"key_num": 1}, {"key_num": 2}]'.encode("utf-8"))
+    pipeout.flush()
+    result = json_rpc_endpoint.recv_response()
+    assert([{"key_num": 1}, {"key_num": 2}] == result)
+
+
+def test_send_requests():
+    pipein, pipeout = os.pipe()
+    pipein = os.fdopen(pipein, "rb")
+    pipeout = os.fdopen(pipeout, "wb")
+    json_rpc_endpoint = pylspclient.JsonRpcEndpoint(pipeout, None)
+    json_rpc_endpoint.send_requests([{"key_num": 1}, {"key_num": 2}])
+    expected = 'Content-Length: 13\r\n\r\n{"key_num":1}Content-Length: 13\r\n\r\n{"key_num":2}'.encode("utf-8")
+    result = pipein.read(len(expected))
+    assert(result == expected)
+
+
+def test_send_requests_larger_than_pipe():
+    pipein, pipeout = os.pipe()
+    pipein = os.fdopen(pipein, "rb")
+    pipeout = os.fdopen(pipeout, "wb")
+    json_rpc_endpoint = pylspclient.JsonRpcEndpoint(pipeout, None)
+    messages = [{"key_str": "x" * 100000, "key_num": i} for i in range(4)]
+    sender = threading.Thread(target=json_rpc_endpoint.send_requests, args=(messages,))
+    sender.start()
+    json_rpc_endpoint = pylspclient.JsonRpcEndpoint(None, pipein)
+    result = [json_rpc_endpoint.recv_response() for _ in messages]
+    sender.join()
+    assert(result == messages)
+
+
+def test_dumps_model(json_backend):
+    item = pylspclient.lsp_structs.CompletionItem(label="a")
+    assert(pylspclient.json_rpc_endpoint.dumps(item) == b'{"label":"a","score":0.0}')
+    context = pylspclient.lsp_structs.CompletionContext(triggerKind=pylspclient.lsp_structs.CompletionTriggerKind.Invoked)
+    assert(pylspclient.json_rpc_endpoint.dumps(context) == b'{"triggerKind":1}')
+
+
+def test_dumps_response_error(json_backend):
+    error = pylspclient.lsp_structs.ResponseError(pylspclient.lsp_structs.ErrorCodes.MethodNotFound, "a")
+    assert(pylspclient.json_rpc_endpoint.dumps(error) == b'{"code":-32601,"message":"a"}')
+    error = pylspclient.lsp_structs.ResponseError(pylspclient.lsp_structs.ErrorCodes.InvalidParams, "a", {"b": 1})
+    assert(pylspclient.json_rpc_endpoint.dumps(error) == b'{"code":-32602,"message":"a","data":{"b":1}}')
@@ -0,0 +1,110 @@
+import json
+import os
+import threading
+
+import pylspclient
+import pytest
+
+
+def read_message(pipe):
+    header = pipe.readline()
+    pipe.readline()
+    size = int(header.decode("utf-8")[len("Content-Length: "):-2])
+    return json.loads(pipe.read(size).decode("utf-8"))
+
+
+def write_message(pipe, message):
+    json_string = json.dumps(message)
+    pipe.write("Content-Length: {}\r\n\r\n{}".format(len(json_string), json_string).encode("utf-8"))
+    pipe.flush()
+
+
+def make_endpoint():
+    client_in, server_out = os.pipe()
+    server_in, client_out = os.pipe()
+    json_rpc_endpoint = pylspclient.JsonRpcEndpoint(os.fdopen(client_out, "wb"), os.fdopen(client_in, "rb"))
+    lsp_endpoint = pylspclient.LspEndpoint(json_rpc_endpoint, timeout=5)
+    lsp_endpoint.daemon = True
+    lsp_endpoint.start()
+    return lsp_endpoint, os.fdopen(server_in, "rb"), os.fdopen(server_out, "wb")
+
+
+def serve_batch(server_in, server_out, reply):
+    def serve():
+        batch = read_message(server_in)
+        write_message(server_out, reply(batch))
+
+    thread = threading.Thread(target=serve, daemon=True)
+    thread.start()
+    return thread
+
+
+def test_call_batch_orders_results():
+    lsp_endpoint, server_in, server_out = make_endpoint()
+    # answer in reverse order, results should still follow the calls.
+    serve_batch(server_in, server_out, lambda batch: [
+        {"jsonrpc": "2.0", "id": m["id"], "result": m["params"]["value"]} for m in reversed(batch)
+    ])
+    result = lsp_endpoint.call_batch([("echo", {"value": 1}), ("echo", {"value": 2})])
+    assert(result == [1, 2])
+
+
+def test_call_batch_rejected():
+    lsp_endpoint, server_in, server_out = make_endpoint()
+    serve_batch(server_in, server_out, lambda batch: {
+        "jsonrpc": "2.0", "id": None, "error": {"code": -32600, "message": "Invalid Request"}
+    })
+    with pytest.raises(pylspclient.lsp_structs.BatchRejectedError):
+        lsp_endpoint.call_batch([("echo", {"value": 1}), ("echo", {"value": 2})])
+
+
+def test_call_batch_element_error():
+    lsp_endpoint, server_in, server_out = make_endpoint()
+    serve_batch(server_in, server_out, lambda batch: [
+        {"jsonrpc": "2.0", "id": batch[0]["id"], "error": {"code": -32602, "message": "Invalid params"}},
+        {"jsonrpc": "2.0", "id": batch[1]["id"], "result": batch[1]["params"]["value"]},
+    ])
+    error, result = lsp_endpoint.call_batch([("echo", {"value": 1}), ("echo", {"value": 2})])
+    assert(type(error) is pylspclient.lsp_structs.ResponseError)
+    assert(error.code == -32602)
+    assert(result == 2)
+
+
+def test_concurrent_call_method():
+    lsp_endpoint, server_in, server_out = make_endpoint()
+
+    def serve():
+        for _ in range(8):
+            request = read_message(server_in)
+            write_message(server_out, {"jsonrpc": "2.0", "id": request["id"], "result": request["params"]["value"]})
+
+    threading.Thread(target=serve, daemon=True).start()
+    results = [None] * 8
+
+    def call(i):
+        results[i] = lsp_endpoint.call_method("echo", value=i)
+
+    threads = [threading.Thread(target=call, args=(i,)) for i in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert(results == list(range(8)))
+
+
+def test_did_open_batch():
+    lsp_endpoint, server_in, server_out = make_endpoint()
+    lsp_client = pylspclient.LspClient(lsp_endpoint)
+    documents = [
+        ("file:///a.py", "python", 1, 'print("é")\n'),
+        ("file:///b.py", "python", 2, ""),
+    ]
+    lsp_client.didOpenBatch(documents)
+    for uri, languageId, version, text in documents:
+        message = read_message(server_in)
+        document = pylspclient.lsp_structs.TextDocumentItem(uri=uri, languageId=languageId, version=version, text=text)
+        assert(message == {
+            "jsonrpc": "2.0",
+            "method": "textDocument/didOpen",
+            "params": {"textDocument": document.dict()},
+        })
@@ -0,0 +1,155 @@
+import pickle
+import pytest
+
+from pylspclient import lsp_structs
+
+RANGE = {"start": {"line": 1, "character": 2}, "end": {"line": 3, "character": 4}}
+
+
+def make_symbol(name, children=None):
+    symbol = {"name": name, "kind": 5, "range": RANGE, "selectionRange": RANGE}
+    if children is not None:
+        symbol["children"] = children
+    return symbol
+
+
+def test_to_type_nested():
+    raw = make_symbol("a", [make_symbol("b", [make_symbol("c")]), make_symbol("d")])
+    symbol = lsp_structs.to_type(raw, lsp_structs.DocumnetSymbol)
+    assert(symbol == lsp_structs.DocumnetSymbol.parse_obj(raw))
+    assert(symbol.kind is lsp_structs.SymbolKind.Class)
+    assert(symbol.children[0].children[0].selectionRange.end.character == 4)
+    assert(symbol.children[1].children == [])
+    assert(symbol.containerName is None)
+
+
+def test_to_type_optional_fields():
+    raw = {"label": "foo", "insertTextFormat": 2, "textEdit": {"range": RANGE, "newText": "foo()"}}
+    item = lsp_structs.to_type(raw, lsp_structs.CompletionItem)
+    assert(item == lsp_structs.CompletionItem.parse_obj(raw))
+    assert(item.insertTextFormat is lsp_structs.InsertTextFormat.Snippet)
+    assert(item.textEdit.range.start.line == 1)
+    assert(item.command is None)
+
+
+def test_to_type_same_type():
+    location = lsp_structs.Location(uri="file:///a", range=RANGE)
+    assert(lsp_structs.to_type(location, lsp_structs.Location) is location)
+
+
+def test_language_identifier_is_str():
+    assert(lsp_structs.LANGUAGE_IDENTIFIER.PHP == "php")
+    assert(str(lsp_structs.LANGUAGE_IDENTIFIER.PHP) == "php")
+    assert(f"{lsp_structs.LANGUAGE_IDENTIFIER.PHP}" == "php")
+    document = lsp_structs.TextDocumentItem(uri="file:///a.php", languageId=lsp_structs.LANGUAGE_IDENTIFIER.PHP, version=1, text="")
+    assert(document.languageId == "php")
+
+
+def test_int_enums_compare_with_wire_values():
+    assert(lsp_structs.DiagnosticSeverity.Error == 1)
+    assert(lsp_structs.SymbolKind(5) == 5)
+    assert(lsp_structs.ErrorCodes.ParseError == -32700)
+
+
+def test_to_type_enum_values():
+    symbol = lsp_structs.to_type(make_symbol("a"), lsp_structs.DocumnetSymbol)
+    assert(symbol.kind is lsp_structs.SymbolKind.Class)
+    with pytest.raises(ValueError):
+        lsp_structs.to_type(dict(make_symbol("a"), kind=1000), lsp_structs.DocumnetSymbol)
+
+
+def test_to_type_built_children():
+    children = [lsp_structs.to_type(make_symbol("b"), lsp_structs.DocumnetSymbol)]
+    symbol = lsp_structs.to_type(make_symbol("a", children), lsp_structs.DocumnetSymbol)
+    assert(symbol.children == children)
+    assert(symbol.children[0] is children[0])
+
+
+def test_to_type_mixed_children():
+    built = lsp_structs.to_type(make_symbol("c"), lsp_structs.DocumnetSymbol)
+    raw = make_symbol("a", [make_symbol("b", [built, make_symbol("d")]), built])
+    symbol = lsp_structs.to_type(raw, lsp_structs.DocumnetSymbol)
+    assert(symbol == lsp_structs.DocumnetSymbol.parse_obj(raw))
+    assert(symbol.children[0].children[0] is built)
+    assert(type(symbol.children[0].children[1]) is lsp_structs.DocumnetSymbol)
+    assert(symbol.children[1] is built)
+
+
+def test_to_type_mixed_list():
+    item = lsp_structs.CompletionItem(label="a")
+    completions = lsp_structs.to_type({"isIncomplete": False, "items": [item, {"label": "b"}]}, lsp_structs.CompletionList)
+    assert(completions.items[0] is item)
+    assert(type(completions.items[1]) is lsp_structs.CompletionItem)
+    assert(completions.items[1].label == "b")
+
+
+def test_to_type_completion_list():
+    raw = {
+        "isIncomplete": False,
+        "items": [
+            {"label": "a", "kind": 3, "textEdit": {"range": RANGE, "newText": "a()"}},
+            {"label": "b", "insertTextFormat": 2},
+        ],
+    }
+    completions = lsp_structs.to_type(raw, lsp_structs.CompletionList)
+    assert(completions == lsp_structs.CompletionList.parse_obj(raw))
+    assert(completions.items[0].textEdit.range.start.line == 1)
+    assert(completions.items[1].insertTextFormat is lsp_structs.InsertTextFormat.Snippet)
+
+
+def test_to_type_defaults():
+    first = lsp_structs.to_type(make_symbol("a"), lsp_structs.DocumnetSymbol)
+    second = lsp_structs.to_type(make_symbol("b"), lsp_structs.DocumnetSymbol)
+    assert(first.__fields_set__ == lsp_structs.DocumnetSymbol.parse_obj(make_symbol("a")).__fields_set__)
+    assert(first.dict() == lsp_structs.DocumnetSymbol.parse_obj(make_symbol("a")).dict())
+    assert(first.children is not second.children)
+    first.children.append(second)
+    assert(second.children == [])
+
+
+def test_to_type_deep_tree():
+    raw = make_symbol("leaf")
+    for i in range(5000):
+        raw = make_symbol(str(i), [raw, make_symbol("sibling")])
+    symbol = lsp_structs.to_type(raw, lsp_structs.DocumnetSymbol)
+    for i in reversed(range(5000)):
+        assert(symbol.name == str(i))
+        assert(symbol.children[1].name == "sibling")
+        symbol = symbol.children[0]
+    assert(symbol.name == "leaf")
+    assert(symbol.children == [])
+
+
+def test_to_type_interns_uris():
+    uri = "".join(["file:///", "a.php"])
+    locations = [lsp_structs.to_type({"uri": "".join(["file:///", "a.php"]), "range": RANGE}, lsp_structs.Location) for _ in range(2)]
+    assert(locations[0].uri == uri)
+    assert(locations[0].uri is locations[1].uri)
+
+
+def test_constructor():
+    construct = lsp_structs.constructor(lsp_structs.Location)
+    assert(construct is lsp_structs.constructor(lsp_structs.Location))
+    assert(construct({"uri": "file:///a.php", "range": RANGE}) == lsp_structs.Location(uri="file:///a.php", range=RANGE))
+
+
+def test_to_type_leaf_children():
+    raw = make_symbol("a", [])
+    symbol = lsp_structs.to_type(raw, lsp_structs.DocumnetSymbol)
+    assert(symbol.children is raw["children"])
+
+
+def test_response_error():
+    error = lsp_structs.ResponseError(lsp_structs.ErrorCodes.MethodNotFound, "Method not found: a")
+    assert(error.data is None)
+    copy = pickle.loads(pickle.dumps(error))
+    assert((copy.code, copy.message, copy.data) == (error.code, error.message, error.data))
+
+
+def test_versioned_text_document_identifier_not_hashable():
+    identifier = lsp_structs.VersionedTextDocumentIdentifier(uri="file:///a.php", version=1)
+    identifier.version = 2
+    assert(identifier.version == 2)
+    with pytest.raises(TypeError):
+        hash(identifier)
+    assert(hash(lsp_structs.TextDocumentIdentifier(uri="file:///a.php")) == hash(lsp_structs.TextDocumentIdentifier(uri="file:///a.php")))
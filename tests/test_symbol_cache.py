@@ -0,0 +1,47 @@
+import symbol_cache
+from pylspclient import lsp_structs
+
+RANGE = {"start": {"line": 1, "character": 2}, "end": {"line": 3, "character": 4}}
+
+
+def make_key(tmp_path, server):
+    source = tmp_path / "a.php"
+    source.write_text("<?php\n")
+    return symbol_cache.cache_key(server, "file://" + str(source), str(source))
+
+
+def test_put_get_document_symbols(tmp_path, monkeypatch):
+    monkeypatch.setattr(symbol_cache, "CACHE_DIR", tmp_path / "cache")
+    key = make_key(tmp_path, "intelephense")
+    child = {"name": "b", "kind": 6, "range": RANGE, "selectionRange": RANGE}
+    symbols = [lsp_structs.DocumnetSymbol.parse_obj({"name": "a", "kind": 5, "range": RANGE, "selectionRange": RANGE, "children": [child]})]
+    assert(symbol_cache.get(key) is None)
+    symbol_cache.put(key, symbols)
+    assert(symbol_cache.get(key) == symbols)
+
+
+def test_put_get_symbol_information(tmp_path, monkeypatch):
+    monkeypatch.setattr(symbol_cache, "CACHE_DIR", tmp_path / "cache")
+    key = make_key(tmp_path, "phpls")
+    symbols = [lsp_structs.SymbolInformation.parse_obj({"name": "a", "kind": 5, "location": {"uri": "file:///a.php", "range": RANGE}})]
+    symbol_cache.put(key, symbols)
+    assert(symbol_cache.get(key) == symbols)
+
+
+def test_key_depends_on_server(tmp_path):
+    assert(make_key(tmp_path, "phpls") != make_key(tmp_path, "intelephense"))
+
+
+def test_get_wrong_shape(tmp_path, monkeypatch):
+    monkeypatch.setattr(symbol_cache, "CACHE_DIR", tmp_path)
+    for i, content in enumerate(["{}", "[1]", '["a"]', "[{}]", '[{"name": "a", "kind": 5, "range": 1}]', "not json"]):
+        symbol_cache.cache_path(str(i)).write_text(content)
+        assert(symbol_cache.get(str(i)) is None)
+
+
+def test_put_unwritable(tmp_path, monkeypatch):
+    # a file where the cache directory should be: the cache can not be written.
+    (tmp_path / "cache").write_text("")
+    monkeypatch.setattr(symbol_cache, "CACHE_DIR", tmp_path / "cache")
+    symbol_cache.put("key", [])
+    assert(symbol_cache.get("key") is None)